@@ -8,27 +8,93 @@ import os
 import json
 import sqlite3
 import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import hashlib
-import requests
+import copy
+import aiohttp
+import ijson
+from aiolimiter import AsyncLimiter
 from typing import List, Dict, Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
-from telegram.error import TelegramError
+from telegram.error import TelegramError, RetryAfter, BadRequest
+from telegram.helpers import escape_markdown
 import asyncio
 
 # ============ CONFIG ============
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 DB_PATH = "freelance_bot.db"
 JOBS_FETCH_INTERVAL = 3600  # 1 hour in seconds
+PUBLIC_URL = os.getenv("PUBLIC_URL")  # HTTPS base URL for webhooks; polling is used when unset
+WEBHOOK_PORT = int(os.getenv("PORT", 8443))
+WEBHOOK_SECRET = os.getenv("TG_SECRET")
+HN_API_URL = "https://hacker-news.firebaseio.com/v0"
+HN_MAX_CONCURRENT_REQUESTS = 20
+HTTP_CONNECTION_LIMIT = 50
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=10)
+HTTP_MAX_RETRIES = 3
+HTTP_RETRY_BACKOFF = 0.5  # seconds, doubled on each retry
+TELEGRAM_MAX_MESSAGES_PER_SECOND = 30  # Bot API global limit
+ALERT_SENDER_WORKERS = 3
+ALERT_DISPATCH_CONCURRENCY = 20
+ALERT_JOBS_PER_USER = 5
+ENABLE_SKILL_FILTERING = os.getenv("ENABLE_SKILL_FILTERING", "1") != "0"  # /skills, matched via jobs_fts
+USER_CACHE_TTL = 30  # seconds
+USER_CACHE_MAX_ENTRIES = 4096
+WRITE_BATCH_MAX_ITEMS = 500
+WRITE_BATCH_MAX_DELAY = 0.1  # seconds
+DELETE_JOBS_OLDER_THAN_DAYS = 30
+DELETE_ALERT_HISTORY_OLDER_THAN_DAYS = 90
+VACUUM_INTERVAL = timedelta(days=7)
+VACUUM_STAMP_PATH = DB_PATH + ".vacuumed"  # mtime records the last VACUUM (shared with cron_worker.py)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # ============ DATABASE ============
+# Tables whose row counts are maintained in the counters table
+COUNTED_TABLES = ("users", "jobs", "user_jobs_sent", "payments")
+
+_SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA foreign_keys=ON",
+)
+
+_local = threading.local()
+
+def _get_conn() -> sqlite3.Connection:
+    """Return this thread's long-lived SQLite connection (opened on first use)"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+        for pragma in _SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        _local.conn = conn
+    return conn
+
+@contextmanager
+def _transaction():
+    """Run a block of writes inside one BEGIN IMMEDIATE/COMMIT"""
+    conn = _get_conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
 def init_db():
     """Initialize SQLite database"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = _get_conn()
     c = conn.cursor()
     
     c.execute('''CREATE TABLE IF NOT EXISTS users (
@@ -38,9 +104,20 @@ def init_db():
         subscription_level TEXT DEFAULT 'free',
         credits_remaining INTEGER DEFAULT 5,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        last_alert_sent TIMESTAMP
+        last_alert_sent TIMESTAMP,
+        last_job_seen_posted_at TIMESTAMP
     )''')
     
+    # Bring databases created before last_job_seen_posted_at up to date
+    user_columns = {row[1] for row in c.execute("PRAGMA table_info(users)")}
+    if "last_job_seen_posted_at" not in user_columns:
+        c.execute("ALTER TABLE users ADD COLUMN last_job_seen_posted_at TIMESTAMP")
+        # Existing premium users pick up alerts from the newest job, not the oldest
+        c.execute("""
+            UPDATE users SET last_job_seen_posted_at = (SELECT MAX(posted_at) FROM jobs)
+            WHERE subscription_level = 'premium'
+        """)
+    
     c.execute('''CREATE TABLE IF NOT EXISTS jobs (
         id TEXT PRIMARY KEY,
         title TEXT,
@@ -62,6 +139,24 @@ def init_db():
         UNIQUE(user_id, job_id)
     )''')
     
+    # Full-text index over job skills, kept in step with jobs by triggers. The
+    # AFTER INSERT trigger fires only for rows INSERT OR IGNORE actually adds, and
+    # the tokenizer splits the stored JSON list into skill words. id is indexed
+    # too so the AFTER DELETE trigger finds its row with a lookup, not a scan.
+    fts_exists = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'jobs_fts'"
+    ).fetchone()
+    c.execute("CREATE VIRTUAL TABLE IF NOT EXISTS jobs_fts USING fts5(id, skills)")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS jobs_fts_insert AFTER INSERT ON jobs BEGIN
+        INSERT INTO jobs_fts (id, skills) VALUES (new.id, new.skills);
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS jobs_fts_delete AFTER DELETE ON jobs BEGIN
+        DELETE FROM jobs_fts
+        WHERE jobs_fts MATCH 'id : "' || replace(old.id, '"', '""') || '"' AND id = old.id;
+    END''')
+    if not fts_exists:
+        c.execute("INSERT INTO jobs_fts (id, skills) SELECT id, skills FROM jobs")
+    
     c.execute('''CREATE TABLE IF NOT EXISTS payments (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER,
@@ -71,292 +166,668 @@ def init_db():
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )''')
     
-    conn.commit()
-    conn.close()
+    # Row counts kept current by triggers, so stats can read them without a full
+    # scan. Missing counters are seeded from the table once, after their triggers exist.
+    c.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    seeded = {row[0] for row in c.execute("SELECT name FROM counters")}
+    for table in COUNTED_TABLES:
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_count_insert AFTER INSERT ON {table} BEGIN
+            UPDATE counters SET value = value + 1 WHERE name = '{table}';
+        END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_count_delete AFTER DELETE ON {table} BEGIN
+            UPDATE counters SET value = value - 1 WHERE name = '{table}';
+        END''')
+        if table not in seeded:
+            c.execute(f"INSERT INTO counters (name, value) SELECT '{table}', COUNT(*) FROM {table}")
+    
+    # Running sum/count of julianday(posted_at) over jobs with a parseable
+    # posted_at, so the average job age is O(1)
+    c.execute('''CREATE TRIGGER IF NOT EXISTS jobs_posted_insert AFTER INSERT ON jobs
+        WHEN julianday(new.posted_at) IS NOT NULL BEGIN
+        UPDATE counters SET value = value + julianday(new.posted_at) WHERE name = 'jobs_posted_julian_sum';
+        UPDATE counters SET value = value + 1 WHERE name = 'jobs_posted_count';
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS jobs_posted_delete AFTER DELETE ON jobs
+        WHEN julianday(old.posted_at) IS NOT NULL BEGIN
+        UPDATE counters SET value = value - julianday(old.posted_at) WHERE name = 'jobs_posted_julian_sum';
+        UPDATE counters SET value = value - 1 WHERE name = 'jobs_posted_count';
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS jobs_posted_update AFTER UPDATE OF posted_at ON jobs BEGIN
+        UPDATE counters SET value = value - COALESCE(julianday(old.posted_at), 0)
+                                          + COALESCE(julianday(new.posted_at), 0)
+        WHERE name = 'jobs_posted_julian_sum';
+        UPDATE counters SET value = value - (julianday(old.posted_at) IS NOT NULL)
+                                          + (julianday(new.posted_at) IS NOT NULL)
+        WHERE name = 'jobs_posted_count';
+    END''')
+    if "jobs_posted_julian_sum" not in seeded:
+        c.execute('''INSERT INTO counters (name, value)
+            SELECT 'jobs_posted_julian_sum', TOTAL(julianday(posted_at)) FROM jobs''')
+        c.execute('''INSERT INTO counters (name, value)
+            SELECT 'jobs_posted_count', COUNT(julianday(posted_at)) FROM jobs''')
+    
+    # Per-user alert totals for the stats leaderboard, kept by triggers on user_jobs_sent
+    uac_exists = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_alert_counts'"
+    ).fetchone()
+    c.execute('''CREATE TABLE IF NOT EXISTS user_alert_counts (
+        user_id INTEGER PRIMARY KEY,
+        n INTEGER NOT NULL DEFAULT 0
+    )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_uac_n ON user_alert_counts(n DESC)")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS user_alert_counts_insert AFTER INSERT ON user_jobs_sent
+        WHEN new.user_id IS NOT NULL BEGIN
+        INSERT INTO user_alert_counts (user_id, n) VALUES (new.user_id, 1)
+        ON CONFLICT(user_id) DO UPDATE SET n = n + 1;
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS user_alert_counts_delete AFTER DELETE ON user_jobs_sent BEGIN
+        UPDATE user_alert_counts SET n = n - 1 WHERE user_id = old.user_id;
+        DELETE FROM user_alert_counts WHERE user_id = old.user_id AND n <= 0;
+    END''')
+    if not uac_exists:
+        c.execute('''INSERT OR REPLACE INTO user_alert_counts (user_id, n)
+            SELECT user_id, COUNT(*) FROM user_jobs_sent WHERE user_id IS NOT NULL GROUP BY user_id''')
+    
+    # Indexes for the unsent-jobs anti-join and premium alert lookup. The
+    # UNIQUE(user_id, job_id) constraint already gives user_jobs_sent a covering
+    # index for the join, so a second copy only slows down inserts.
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_posted_at ON jobs(posted_at DESC)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_sub_level ON users(subscription_level, last_alert_sent)")
+    
+    # Indexes for stats.py: sent_at range counts (covering user_id for the
+    # active-user count), per-platform counts and the last-fetch lookup. The
+    # sent_at prefix also serves cleanup's range delete.
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ujs_sent_user ON user_jobs_sent(sent_at, user_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_platform ON jobs(platform)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_fetched ON jobs(fetched_at)")
+    
+    # Refresh planner statistics so the new indexes get picked up
+    c.execute("ANALYZE")
+
+# Short-lived per-user cache: entries expire after USER_CACHE_TTL so writes from
+# outside this process show up, and create_or_update_user drops its own key.
+# _user_cache_writes stops a read that raced a write from storing the old row.
+_user_cache: Dict[int, tuple] = {}
+_user_cache_lock = threading.Lock()
+_user_cache_writes = 0
 
 def get_user(telegram_id: int) -> Optional[Dict]:
-    """Fetch user from DB"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    """Fetch user from DB (cached for USER_CACHE_TTL; create_or_update_user invalidates)"""
+    now = time.monotonic()
+    with _user_cache_lock:
+        entry = _user_cache.get(telegram_id)
+        if entry and entry[0] > now:
+            return copy.deepcopy(entry[1])
+        writes = _user_cache_writes
+    
+    user = _load_user(telegram_id)
+    
+    with _user_cache_lock:
+        if writes == _user_cache_writes:
+            if len(_user_cache) >= USER_CACHE_MAX_ENTRIES:
+                _user_cache.pop(next(iter(_user_cache)))
+            _user_cache[telegram_id] = (now + USER_CACHE_TTL, user)
+    return copy.deepcopy(user)
+
+def _invalidate_user(telegram_id: int):
+    """Drop one user's cached row (call after the write commits)"""
+    global _user_cache_writes
+    with _user_cache_lock:
+        _user_cache_writes += 1
+        _user_cache.pop(telegram_id, None)
+
+def _load_user(telegram_id: int) -> Optional[Dict]:
+    """Read one user row"""
+    c = _get_conn().cursor()
+    c.row_factory = sqlite3.Row
     c.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
     row = c.fetchone()
-    conn.close()
     
     if not row:
         return None
     
     return {
-        "id": row[0],
-        "telegram_id": row[1],
-        "filters": json.loads(row[2]) if row[2] else {},
-        "subscription_level": row[3],
-        "credits_remaining": row[4],
-        "created_at": row[5],
-        "last_alert_sent": row[6]
+        "id": row["id"],
+        "telegram_id": row["telegram_id"],
+        "filters": json.loads(row["filters_json"]) if row["filters_json"] else {},
+        "subscription_level": row["subscription_level"],
+        "credits_remaining": row["credits_remaining"],
+        "created_at": row["created_at"],
+        "last_alert_sent": row["last_alert_sent"],
+        "last_job_seen_posted_at": row["last_job_seen_posted_at"]
     }
 
-def create_or_update_user(telegram_id: int, filters: Dict = None, subscription_level: str = "free"):
-    """Create/update user"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+def create_or_update_user(telegram_id: int, filters: Dict = None, subscription_level: str = None):
+    """Create/update user; filters or subscription_level left as None keep their stored value
+    
+    Becoming premium starts the alert cursor at the newest job, so the first
+    alerts are current postings rather than the oldest jobs still stored.
+    """
+    c = _get_conn().cursor()
     
     user = get_user(telegram_id)
-    filters_json = json.dumps(filters or {})
+    params = {
+        "telegram_id": telegram_id,
+        "filters_json": json.dumps(filters) if filters is not None else None,
+        "subscription_level": subscription_level,
+    }
     
     if user:
-        c.execute(
-            "UPDATE users SET filters_json = ?, subscription_level = ? WHERE telegram_id = ?",
-            (filters_json, subscription_level, telegram_id)
-        )
+        c.execute("""
+            UPDATE users SET
+                filters_json = COALESCE(:filters_json, filters_json),
+                last_job_seen_posted_at = CASE
+                    WHEN :subscription_level = 'premium' AND subscription_level != 'premium'
+                    THEN (SELECT MAX(posted_at) FROM jobs)
+                    ELSE last_job_seen_posted_at END,
+                subscription_level = COALESCE(:subscription_level, subscription_level)
+            WHERE telegram_id = :telegram_id
+        """, params)
     else:
-        c.execute(
-            "INSERT INTO users (telegram_id, filters_json, subscription_level) VALUES (?, ?, ?)",
-            (telegram_id, filters_json, subscription_level)
-        )
+        c.execute("""
+            INSERT INTO users (telegram_id, filters_json, subscription_level, last_job_seen_posted_at)
+            VALUES (:telegram_id, COALESCE(:filters_json, '{}'), COALESCE(:subscription_level, 'free'),
+                    CASE WHEN :subscription_level = 'premium' THEN (SELECT MAX(posted_at) FROM jobs) END)
+        """, params)
     
-    conn.commit()
-    conn.close()
+    _invalidate_user(telegram_id)
+
+def _job_id(job: Dict) -> str:
+    """Source-provided job id, or a stable hash of platform + URL (title if no URL)"""
+    if job.get("id"):
+        return job["id"]
+    key = f"{job.get('platform')}|{job.get('url') or job.get('title', '')}"
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
 
 def save_jobs(jobs: List[Dict]):
     """Save fetched jobs to DB"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    rows = [
+        (_job_id(job),
+         job.get("title"), job.get("description"),
+         job.get("budget_min"), job.get("budget_max"),
+         json.dumps(job.get("skills", [])), job.get("url"),
+         job.get("platform"), job.get("posted_at"))
+        for job in jobs
+    ]
     
-    for job in jobs:
-        job_id = job.get("id", hashlib.md5(job.get("title", "").encode()).hexdigest())
+    try:
+        with _transaction() as conn:
+            conn.executemany('''INSERT OR IGNORE INTO jobs 
+                (id, title, description, budget_min, budget_max, skills, url, platform, posted_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+    except Exception as e:
+        logger.error(f"Error saving {len(rows)} jobs: {e}")
+
+# Job queries are fixed strings: unset filters bind as NULL instead of changing
+# the SQL, so each connection's statement cache reuses one prepared statement.
+_SQL_UNSENT_JOBS = """
+    SELECT j.* FROM jobs j
+    LEFT JOIN user_jobs_sent u ON u.job_id = j.id AND u.user_id = :user_id
+    WHERE u.job_id IS NULL
+    AND (:min_budget IS NULL OR j.budget_max IS NULL OR j.budget_max >= :min_budget)
+    AND (:max_budget IS NULL OR j.budget_min IS NULL OR j.budget_min <= :max_budget)
+    AND (:skills IS NULL OR j.id IN (SELECT id FROM jobs_fts WHERE jobs_fts MATCH :skills))
+    ORDER BY j.posted_at DESC LIMIT 10
+"""
+
+# Oldest first, so the cursor only ever moves over jobs that were delivered;
+# `>=` plus the marker check keeps jobs sharing the cursor's timestamp
+_SQL_NEW_JOBS = """
+    SELECT * FROM jobs
+    WHERE posted_at >= :since
+    AND NOT EXISTS (SELECT 1 FROM user_jobs_sent u WHERE u.user_id = :user_id AND u.job_id = jobs.id)
+    AND (:min_budget IS NULL OR budget_max IS NULL OR budget_max >= :min_budget)
+    AND (:max_budget IS NULL OR budget_min IS NULL OR budget_min <= :max_budget)
+    AND (:skills IS NULL OR id IN (SELECT id FROM jobs_fts WHERE jobs_fts MATCH :skills))
+    ORDER BY posted_at ASC, id ASC LIMIT :limit
+"""
+
+def _skills_match(skills: List[str]) -> Optional[str]:
+    """FTS5 MATCH expression for any of the given skills (each quoted as a phrase)"""
+    phrases = ['"' + skill.replace('"', '""') + '"' for skill in skills if skill.strip()]
+    return f"skills : ({' OR '.join(phrases)})" if phrases else None
+
+def _filter_params(filters: Dict) -> Dict:
+    """Budget and skill filter bind parameters, NULL when unset"""
+    return {
+        "min_budget": filters.get("min_budget") or None,
+        "max_budget": filters.get("max_budget") or None,
+        "skills": _skills_match(filters.get("skills") or []) if ENABLE_SKILL_FILTERING else None,
+    }
+
+def get_unsent_jobs(user_id: int, filters: Dict) -> List[Dict]:
+    """Get jobs matching user filters that haven't been sent yet"""
+    c = _get_conn().cursor()
+    c.row_factory = sqlite3.Row
+    
+    c.execute(_SQL_UNSENT_JOBS, {"user_id": user_id, **_filter_params(filters)})
+    return [_job_from_row(row) for row in c.fetchall()]
+
+def get_new_jobs(user_id: int, filters: Dict, since: Optional[str], limit: int) -> List[Dict]:
+    """Get the oldest unsent jobs matching user filters from the user's last-seen cursor on
+    
+    Every alert delivered to a user advances their last_job_seen_posted_at, so a
+    range scan over idx_jobs_posted_at keeps the marker check down to a few rows.
+    """
+    c = _get_conn().cursor()
+    c.row_factory = sqlite3.Row
+    
+    c.execute(_SQL_NEW_JOBS, {"user_id": user_id, "since": since or "1970-01-01",
+                              "limit": limit, **_filter_params(filters)})
+    return [_job_from_row(row) for row in c.fetchall()]
+
+def _job_from_row(row: sqlite3.Row) -> Dict:
+    """Build the job dict handed to message formatting"""
+    return {
+        "id": row["id"],
+        "title": row["title"],
+        "description": row["description"],
+        "budget_min": row["budget_min"],
+        "budget_max": row["budget_max"],
+        "skills": json.loads(row["skills"]) if row["skills"] else [],
+        "url": row["url"],
+        "platform": row["platform"],
+        "posted_at": row["posted_at"]
+    }
+
+# Sent markers are written asynchronously: callers enqueue (user_id, job_id,
+# is_alert) items and a background thread commits them in micro-batches, so many users'
+# markers share one transaction instead of paying a commit each.
+_write_queue: "queue.Queue" = queue.Queue()
+_flusher: Optional[threading.Thread] = None
+_flusher_lock = threading.Lock()
+_FLUSHER_STOP = object()
+
+def _flush_sent_batch(batch: List[tuple]):
+    """Write one batch of sent markers and advance alert timestamps and job cursors
+    
+    Only alert deliveries move last_alert_sent and last_job_seen_posted_at;
+    jobs browsed via /jobs are just marked sent.
+    """
+    now = datetime.now().isoformat()
+    alerts = [(user_id, job_id) for user_id, job_id, is_alert in batch if is_alert]
+    user_ids = {user_id for user_id, _ in alerts}
+    with _transaction() as conn:
+        conn.executemany("INSERT OR IGNORE INTO user_jobs_sent (user_id, job_id) VALUES (?, ?)",
+                         [(user_id, job_id) for user_id, job_id, _ in batch])
+        conn.executemany("UPDATE users SET last_alert_sent = ? WHERE id = ?",
+                         [(now, user_id) for user_id in user_ids])
+        conn.executemany("""
+            UPDATE users SET last_job_seen_posted_at = NULLIF(MAX(
+                COALESCE(last_job_seen_posted_at, ''),
+                COALESCE((SELECT posted_at FROM jobs WHERE id = ?), '')
+            ), '') WHERE id = ?
+        """, [(job_id, user_id) for user_id, job_id in alerts])
+
+def _flusher_loop():
+    """Drain the write queue in batches of up to WRITE_BATCH_MAX_ITEMS / WRITE_BATCH_MAX_DELAY"""
+    stopping = False
+    while not stopping:
+        item = _write_queue.get()
+        if item is _FLUSHER_STOP:
+            break
+        
+        batch = [item]
+        deadline = time.monotonic() + WRITE_BATCH_MAX_DELAY
+        while len(batch) < WRITE_BATCH_MAX_ITEMS:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = _write_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _FLUSHER_STOP:
+                stopping = True
+                break
+            batch.append(item)
         
         try:
-            c.execute('''INSERT OR IGNORE INTO jobs 
-                (id, title, description, budget_min, budget_max, skills, url, platform, posted_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                (job_id, job.get("title"), job.get("description"), 
-                 job.get("budget_min"), job.get("budget_max"),
-                 json.dumps(job.get("skills", [])), job.get("url"),
-                 job.get("platform"), job.get("posted_at")))
+            _flush_sent_batch(batch)
         except Exception as e:
-            logger.error(f"Error saving job {job_id}: {e}")
+            logger.error(f"Error writing {len(batch)} sent markers: {e}")
+
+def _ensure_flusher():
+    """Start the background writer thread if it isn't running"""
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flusher_loop, name="db-flusher", daemon=True)
+            _flusher.start()
+
+def stop_write_flusher():
+    """Flush any pending sent markers and stop the writer thread"""
+    with _flusher_lock:
+        if _flusher is not None and _flusher.is_alive():
+            _write_queue.put(_FLUSHER_STOP)
+            _flusher.join()
+
+def mark_jobs_sent(user_id: int, job_ids: List[str], is_alert: bool = False):
+    """Mark jobs as sent to user (written by the background flusher)
     
-    conn.commit()
-    conn.close()
+    Pass is_alert for premium alert deliveries so they advance the user's cursor.
+    """
+    _ensure_flusher()
+    for job_id in job_ids:
+        _write_queue.put((user_id, job_id, is_alert))
 
-def get_unsent_jobs(user_id: int, telegram_id: int) -> List[Dict]:
-    """Get jobs matching user filters that haven't been sent yet"""
-    user = get_user(telegram_id)
-    if not user:
-        return []
+def get_premium_users() -> List[tuple]:
+    """(id, telegram_id, filters_json, last_job_seen_posted_at) for every premium user"""
+    c = _get_conn().cursor()
+    c.execute("""
+        SELECT id, telegram_id, filters_json, last_job_seen_posted_at FROM users
+        WHERE subscription_level = 'premium'
+    """)
+    return c.fetchall()
+
+def cleanup_old_jobs():
+    """Remove old jobs and alert history, then run database maintenance"""
+    c = _get_conn().cursor()
     
-    filters = user.get("filters", {})
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    jobs_cutoff = (datetime.now() - timedelta(days=DELETE_JOBS_OLDER_THAN_DAYS)).isoformat()
+    c.execute("DELETE FROM jobs WHERE posted_at < ?", (jobs_cutoff,))
+    deleted = c.rowcount
     
-    # Build query based on filters
-    query = "SELECT * FROM jobs WHERE id NOT IN (SELECT job_id FROM user_jobs_sent WHERE user_id = ?)"
-    params = [user_id]
-    
-    if filters.get("min_budget"):
-        query += " AND (budget_max IS NULL OR budget_max >= ?)"
-        params.append(filters["min_budget"])
-    
-    if filters.get("max_budget"):
-        query += " AND (budget_min IS NULL OR budget_min <= ?)"
-        params.append(filters["max_budget"])
-    
-    if filters.get("skills"):
-        # TODO: Implement skill matching (for MVP, skip)
-        pass
-    
-    query += " ORDER BY posted_at DESC LIMIT 10"
-    
-    c.execute(query, params)
-    rows = c.fetchall()
-    conn.close()
-    
-    results = []
-    for row in rows:
-        results.append({
-            "id": row[0],
-            "title": row[1],
-            "description": row[2],
-            "budget_min": row[3],
-            "budget_max": row[4],
-            "skills": json.loads(row[5]) if row[5] else [],
-            "url": row[6],
-            "platform": row[7]
-        })
+    # Drop sent markers whose job is gone once they age out of the history window
+    history_cutoff = (datetime.now() - timedelta(days=DELETE_ALERT_HISTORY_OLDER_THAN_DAYS)).isoformat(sep=" ")
+    c.execute("""
+        DELETE FROM user_jobs_sent
+        WHERE sent_at < ?
+        AND NOT EXISTS (SELECT 1 FROM jobs WHERE jobs.id = user_jobs_sent.job_id)
+    """, (history_cutoff,))
+    deleted_history = c.rowcount
+    
+    logger.info(f"Cleaned up {deleted} old jobs and {deleted_history} old alert records")
     
-    return results
+    # Keep planner statistics current after bulk deletes
+    c.execute("PRAGMA optimize")
+    c.execute("ANALYZE")
+    
+    # Reclaim free pages at most once a week; the stamp survives restarts
+    try:
+        last_vacuum = datetime.fromtimestamp(os.path.getmtime(VACUUM_STAMP_PATH))
+    except OSError:
+        last_vacuum = None
+    if last_vacuum is None or datetime.now() - last_vacuum >= VACUUM_INTERVAL:
+        logger.info("Vacuuming database...")
+        c.execute("VACUUM")
+        with open(VACUUM_STAMP_PATH, "w") as f:
+            f.write(datetime.now().isoformat())
 
-def mark_jobs_sent(user_id: int, job_ids: List[str]):
-    """Mark jobs as sent to user"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+# ============ HTTP ============
+_http_session: Optional[aiohttp.ClientSession] = None
+
+# url -> {"etag", "last_modified", "data"} from the last 200 response
+_http_cache: Dict[str, Dict] = {}
+
+def _get_http_session() -> aiohttp.ClientSession:
+    """Return the long-lived HTTP session, (re)creating it if needed"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(limit=HTTP_CONNECTION_LIMIT)
+        _http_session = aiohttp.ClientSession(connector=connector)
+    return _http_session
+
+async def _close_http_session():
+    """Close the shared HTTP session on shutdown"""
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+
+async def _get_json(session: aiohttp.ClientSession, url: str, limit: Optional[int] = None):
+    """GET a JSON feed with retries, reusing the cached body on 304 Not Modified
     
-    for job_id in job_ids:
-        try:
-            c.execute("INSERT OR IGNORE INTO user_jobs_sent (user_id, job_id) VALUES (?, ?)",
-                     (user_id, job_id))
-        except:
-            pass
+    With ``limit``, the top-level array is streamed and only its first ``limit``
+    items are parsed; the rest of the body is never read.
+    """
+    cached = _http_cache.get(url)
+    headers = {}
+    if cached:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
     
-    conn.commit()
-    conn.close()
+    for attempt in range(HTTP_MAX_RETRIES):
+        try:
+            async with session.get(url, headers=headers, timeout=HTTP_TIMEOUT) as response:
+                if response.status == 304 and cached:
+                    return cached["data"]
+                if response.status != 200:
+                    return None
+                if limit is None:
+                    data = await response.json(content_type=None)
+                else:
+                    data = []
+                    async for item in ijson.items_async(response.content, "item", use_float=True):
+                        data.append(item)
+                        if len(data) >= limit:
+                            break
+                
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+                if etag or last_modified:
+                    _http_cache[url] = {"etag": etag, "last_modified": last_modified, "data": data}
+                return data
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt == HTTP_MAX_RETRIES - 1:
+                raise
+            await asyncio.sleep(HTTP_RETRY_BACKOFF * 2 ** attempt)
 
 # ============ JOB FETCHERS ============
-def fetch_remoteok_jobs() -> List[Dict]:
+async def fetch_remoteok_jobs(session: aiohttp.ClientSession) -> List[Dict]:
     """Fetch jobs from RemoteOK (free API)"""
     try:
-        response = requests.get("https://remoteok.io/api", timeout=10)
         jobs = []
+        data = await _get_json(session, "https://remoteok.io/api", limit=20)  # Limit to 20 to avoid spam
+        if not data:
+            return jobs
         
-        if response.status_code == 200:
-            data = response.json()
-            for job in data[:20]:  # Limit to 20 to avoid spam
-                # Skip non-job entries
-                if job.get("type") != "job":
-                    continue
-                
-                jobs.append({
-                    "id": f"remoteok_{job.get('id')}",
-                    "title": job.get("position"),
-                    "description": job.get("description", "")[:500],
-                    "budget_min": None,
-                    "budget_max": None,
-                    "skills": job.get("tags", []),
-                    "url": job.get("url"),
-                    "platform": "RemoteOK",
-                    "posted_at": datetime.now().isoformat()
-                })
+        for job in data:
+            # Skip non-job entries
+            if job.get("type") != "job":
+                continue
+            
+            jobs.append({
+                "id": f"remoteok_{job.get('id')}",
+                "title": job.get("position"),
+                "description": job.get("description", "")[:500],
+                "budget_min": None,
+                "budget_max": None,
+                "skills": job.get("tags", []),
+                "url": job.get("url"),
+                "platform": "RemoteOK",
+                "posted_at": datetime.now().isoformat()
+            })
         
         return jobs
     except Exception as e:
         logger.error(f"Error fetching RemoteOK jobs: {e}")
         return []
 
-def fetch_hn_jobs() -> List[Dict]:
+async def _fetch_hn_item(session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, job_id: int) -> Optional[Dict]:
+    """Fetch a single HN item, bounded by the shared semaphore"""
+    async with semaphore:
+        async with session.get(f"{HN_API_URL}/item/{job_id}.json") as response:
+            if response.status != 200:
+                return None
+            return await response.json()
+
+async def fetch_hn_jobs(session: aiohttp.ClientSession) -> List[Dict]:
     """Fetch jobs from Hacker News Jobs API"""
     try:
         # HN API for job stories
-        response = requests.get(
-            "https://hacker-news.firebaseio.com/v0/jobstories.json",
-            timeout=10
+        job_ids = await _get_json(session, f"{HN_API_URL}/jobstories.json", limit=10)  # Get first 10
+        if not job_ids:
+            return []
+        
+        # Fetch the items concurrently instead of one round-trip at a time
+        semaphore = asyncio.Semaphore(HN_MAX_CONCURRENT_REQUESTS)
+        results = await asyncio.gather(
+            *[asyncio.wait_for(_fetch_hn_item(session, semaphore, job_id), timeout=5)
+              for job_id in job_ids],
+            return_exceptions=True
         )
         
         jobs = []
-        if response.status_code == 200:
-            job_ids = response.json()[:10]  # Get first 10
+        for job_data in results:
+            if isinstance(job_data, Exception):
+                logger.warning(f"Error fetching HN item: {job_data!r}")
+                continue
+            if not job_data:
+                continue
             
-            for job_id in job_ids:
-                job_response = requests.get(
-                    f"https://hacker-news.firebaseio.com/v0/item/{job_id}.json",
-                    timeout=5
-                )
-                
-                if job_response.status_code == 200:
-                    job_data = job_response.json()
-                    
-                    jobs.append({
-                        "id": f"hn_{job_data.get('id')}",
-                        "title": job_data.get("title"),
-                        "description": job_data.get("text", "")[:500],
-                        "budget_min": None,
-                        "budget_max": None,
-                        "skills": [],
-                        "url": job_data.get("url", ""),
-                        "platform": "Hacker News",
-                        "posted_at": datetime.now().isoformat()
-                    })
+            jobs.append({
+                "id": f"hn_{job_data.get('id')}",
+                "title": job_data.get("title"),
+                "description": job_data.get("text", "")[:500],
+                "budget_min": None,
+                "budget_max": None,
+                "skills": [],
+                "url": job_data.get("url", ""),
+                "platform": "Hacker News",
+                "posted_at": datetime.now().isoformat()
+            })
         
         return jobs
     except Exception as e:
         logger.error(f"Error fetching HN jobs: {e}")
         return []
 
-def fetch_github_jobs() -> List[Dict]:
+async def fetch_github_jobs(session: aiohttp.ClientSession) -> List[Dict]:
     """Fetch jobs from GitHub Jobs API (deprecated but still works)"""
     try:
-        response = requests.get(
-            "https://api.github.com/repos/github/jobs/issues?labels=job&per_page=20",
-            timeout=10
+        jobs = []
+        issues = await _get_json(
+            session, "https://api.github.com/repos/github/jobs/issues?labels=job&per_page=10", limit=10
         )
+        if not issues:
+            return jobs
         
-        jobs = []
-        if response.status_code == 200:
-            issues = response.json()
-            
-            for issue in issues[:10]:
-                jobs.append({
-                    "id": f"gh_{issue.get('id')}",
-                    "title": issue.get("title"),
-                    "description": issue.get("body", "")[:500],
-                    "budget_min": None,
-                    "budget_max": None,
-                    "skills": [],
-                    "url": issue.get("html_url"),
-                    "platform": "GitHub",
-                    "posted_at": issue.get("created_at")
-                })
+        for issue in issues:
+            jobs.append({
+                "id": f"gh_{issue.get('id')}",
+                "title": issue.get("title"),
+                "description": issue.get("body", "")[:500],
+                "budget_min": None,
+                "budget_max": None,
+                "skills": [],
+                "url": issue.get("html_url"),
+                "platform": "GitHub",
+                "posted_at": issue.get("created_at")
+            })
         
         return jobs
     except Exception as e:
         logger.error(f"Error fetching GitHub jobs: {e}")
         return []
 
-def fetch_all_jobs() -> List[Dict]:
-    """Fetch from all sources"""
+async def fetch_all_jobs() -> List[Dict]:
+    """Fetch from all sources concurrently over one shared HTTP session"""
+    session = _get_http_session()
+    results = await asyncio.gather(
+        fetch_remoteok_jobs(session),
+        fetch_hn_jobs(session),
+        fetch_github_jobs(session),
+        return_exceptions=True
+    )
+    
     all_jobs = []
-    all_jobs.extend(fetch_remoteok_jobs())
-    all_jobs.extend(fetch_hn_jobs())
-    all_jobs.extend(fetch_github_jobs())
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Error fetching jobs: {result}")
+            continue
+        all_jobs.extend(result)
     
     logger.info(f"Fetched {len(all_jobs)} total jobs")
-    save_jobs(all_jobs)
+    # The write may wait on the lock held by the flusher or cron_worker, so keep it off the loop
+    await asyncio.to_thread(save_jobs, all_jobs)
     
     return all_jobs
 
+# ============ MESSAGES ============
+# Static replies and keyboards are built once at import and shared by every call
+_START_TEXT = (
+    "🚀 **Welcome to Freelance Job Alerts!**\n\n"
+    "Get notified about new jobs matching your skills and budget.\n\n"
+    "Commands:\n"
+    "• /filter - Set your job preferences\n"
+    "• /jobs - Get current job matches\n"
+    "• /upgrade - Go premium (unlimited alerts)\n"
+    "• /help - Show help\n\n"
+    "_Free tier: 5 jobs/day_\n"
+    "_Premium: Unlimited + hourly alerts_"
+)
+
+_FILTER_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("💰 Budget Range", callback_data="filter_budget")],
+    [InlineKeyboardButton("🛠️ Skills", callback_data="filter_skills")],
+    [InlineKeyboardButton("📍 Job Type", callback_data="filter_type")],
+    [InlineKeyboardButton("✅ Done", callback_data="filter_done")]
+])
+
+_UPGRADE_TEXT = (
+    "💎 **Premium Features**\n"
+    "• Unlimited job alerts\n"
+    "• Hourly notifications\n"
+    "• Advanced filtering\n"
+    "• Skill matching\n\n"
+    "Choose a plan:"
+)
+
+_UPGRADE_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("1 Month - 200 ⭐", callback_data="upgrade_month")],
+    [InlineKeyboardButton("3 Months - 500 ⭐", callback_data="upgrade_3m")],
+])
+
+_HELP_TEXT = (
+    "📖 **Help**\n\n"
+    "/start - Initialize bot\n"
+    "/jobs - Show matching jobs\n"
+    "/filter - Set preferences\n"
+    + ("/skills python django - Only match these skills\n" if ENABLE_SKILL_FILTERING else "") +
+    "/upgrade - Go premium\n"
+    "/help - This message\n\n"
+    "**Free vs Premium:**\n"
+    "Free: 5 jobs/day, manual checks\n"
+    "Premium: Unlimited, hourly alerts\n\n"
+    "Questions? Support coming soon!"
+)
+
+# Filled with str.format_map(job); ".200" truncates the description
+_JOB_TEMPLATE = (
+    "**{title}**\n"
+    "Platform: {platform}\n"
+    "Budget: ${budget_min}-${budget_max}\n\n"
+    "{description:.200}...\n\n"
+    "[View Job]({url})"
+)
+
+_ALERT_JOB_TEMPLATE = "*{title}* ({platform})\n[View]({url})"
+
+_SKILLS_USAGE_TEXT = "Send /skills followed by your skills, e.g. `/skills python django`\n/skills on its own clears them."
+
 # ============ TELEGRAM HANDLERS ============
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
     telegram_id = update.effective_user.id
-    create_or_update_user(telegram_id)
-    
-    message = (
-        "🚀 **Welcome to Freelance Job Alerts!**\n\n"
-        "Get notified about new jobs matching your skills and budget.\n\n"
-        "Commands:\n"
-        "• /filter - Set your job preferences\n"
-        "• /jobs - Get current job matches\n"
-        "• /upgrade - Go premium (unlimited alerts)\n"
-        "• /help - Show help\n\n"
-        "_Free tier: 5 jobs/day_\n"
-        "_Premium: Unlimited + hourly alerts_"
-    )
+    await asyncio.to_thread(create_or_update_user, telegram_id)
     
-    await update.message.reply_text(message, parse_mode="Markdown")
+    await update.message.reply_text(_START_TEXT, parse_mode="Markdown")
 
 async def show_filters(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show filter setup"""
-    telegram_id = update.effective_user.id
-    
-    keyboard = [
-        [InlineKeyboardButton("💰 Budget Range", callback_data="filter_budget")],
-        [InlineKeyboardButton("🛠️ Skills", callback_data="filter_skills")],
-        [InlineKeyboardButton("📍 Job Type", callback_data="filter_type")],
-        [InlineKeyboardButton("✅ Done", callback_data="filter_done")]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text("Configure your preferences:", reply_markup=reply_markup)
+    await update.message.reply_text("Configure your preferences:", reply_markup=_FILTER_MARKUP)
 
 async def show_jobs(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send user their matching jobs"""
     telegram_id = update.effective_user.id
-    user = get_user(telegram_id)
+    user = await asyncio.to_thread(get_user, telegram_id)
     
     if not user:
         await update.message.reply_text("Please /start first")
         return
     
-    jobs = get_unsent_jobs(user["id"], telegram_id)
+    jobs = await asyncio.to_thread(get_unsent_jobs, user["id"], user["filters"])
     
     if not jobs:
         await update.message.reply_text("No matching jobs found. Try adjusting your filters with /filter")
@@ -371,13 +842,7 @@ async def show_jobs(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     job_ids_sent = []
     for job in jobs:
-        job_text = (
-            f"**{job['title']}**\n"
-            f"Platform: {job['platform']}\n"
-            f"Budget: ${job['budget_min']}-${job['budget_max']}\n\n"
-            f"{job['description'][:200]}...\n\n"
-            f"[View Job]({job['url']})"
-        )
+        job_text = _JOB_TEMPLATE.format_map(job)
         
         try:
             await update.message.reply_text(job_text, parse_mode="Markdown")
@@ -395,24 +860,27 @@ async def show_jobs(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Upgrade to premium for unlimited access: /upgrade"
         )
 
+async def set_skills(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Set (or clear) the skills jobs must match"""
+    telegram_id = update.effective_user.id
+    user = await asyncio.to_thread(get_user, telegram_id)
+    
+    if not user:
+        await update.message.reply_text("Please /start first")
+        return
+    
+    skills = [skill.strip(",").lower() for skill in context.args]
+    filters = {**user["filters"], "skills": [skill for skill in skills if skill]}
+    await asyncio.to_thread(create_or_update_user, telegram_id, filters)
+    
+    if filters["skills"]:
+        await update.message.reply_text(f"🛠️ Matching jobs for: {', '.join(filters['skills'])}")
+    else:
+        await update.message.reply_text(f"🛠️ Skill filter cleared.\n{_SKILLS_USAGE_TEXT}", parse_mode="Markdown")
+
 async def upgrade(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show upgrade options"""
-    keyboard = [
-        [InlineKeyboardButton("1 Month - 200 ⭐", callback_data="upgrade_month")],
-        [InlineKeyboardButton("3 Months - 500 ⭐", callback_data="upgrade_3m")],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.message.reply_text(
-        "💎 **Premium Features**\n"
-        "• Unlimited job alerts\n"
-        "• Hourly notifications\n"
-        "• Advanced filtering\n"
-        "• Skill matching\n\n"
-        "Choose a plan:",
-        reply_markup=reply_markup,
-        parse_mode="Markdown"
-    )
+    await update.message.reply_text(_UPGRADE_TEXT, reply_markup=_UPGRADE_MARKUP, parse_mode="Markdown")
 
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle inline button presses"""
@@ -431,87 +899,167 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # In production, use Telegram's payment API
         # For MVP, just mark as premium
-        create_or_update_user(telegram_id, subscription_level="premium")
+        await asyncio.to_thread(create_or_update_user, telegram_id, subscription_level="premium")
         
         await query.answer("✅ You're now premium!")
         await query.edit_message_text(f"Great! You have premium access for {days} days.\n/jobs to start!")
     
+    elif query.data == "filter_skills" and ENABLE_SKILL_FILTERING:
+        await query.message.reply_text(_SKILLS_USAGE_TEXT, parse_mode="Markdown")
+    
     await query.answer()
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show help"""
-    help_text = (
-        "📖 **Help**\n\n"
-        "/start - Initialize bot\n"
-        "/jobs - Show matching jobs\n"
-        "/filter - Set preferences\n"
-        "/upgrade - Go premium\n"
-        "/help - This message\n\n"
-        "**Free vs Premium:**\n"
-        "Free: 5 jobs/day, manual checks\n"
-        "Premium: Unlimited, hourly alerts\n\n"
-        "Questions? Support coming soon!"
+    await update.message.reply_text(_HELP_TEXT, parse_mode="Markdown")
+
+# ============ OUTBOUND QUEUE ============
+# Alerts are queued as (telegram_id, text, user_id, job_ids) and drained by a few
+# workers sharing one limiter, so bursts never exceed Telegram's global rate cap.
+_alert_queue: asyncio.Queue = asyncio.Queue()
+_send_limiter = AsyncLimiter(TELEGRAM_MAX_MESSAGES_PER_SECOND, 1)
+_alert_workers: List[asyncio.Task] = []
+
+async def _send_rate_limited(bot, chat_id: int, text: str, parse_mode: Optional[str] = "Markdown"):
+    """Send a message (Markdown by default) within the global rate limit, honouring RetryAfter"""
+    while True:
+        async with _send_limiter:
+            try:
+                return await bot.send_message(chat_id, text, parse_mode=parse_mode)
+            except RetryAfter as e:
+                retry_after = e.retry_after
+        logger.warning(f"Rate limited by Telegram, retrying in {retry_after}s")
+        await asyncio.sleep(retry_after)
+
+async def _alert_sender(bot):
+    """Worker: deliver queued alerts and mark their jobs as sent"""
+    while True:
+        telegram_id, text, user_id, job_ids = await _alert_queue.get()
+        try:
+            try:
+                await _send_rate_limited(bot, telegram_id, text)
+            except BadRequest as e:
+                # Markdown Telegram can't parse would otherwise block this user's
+                # cursor for good; deliver it as plain text instead
+                logger.warning(f"Alert to {telegram_id} rejected ({e}), resending as plain text")
+                await _send_rate_limited(bot, telegram_id, text, parse_mode=None)
+            mark_jobs_sent(user_id, job_ids, is_alert=True)
+        except Exception as e:
+            logger.error(f"Error sending alert to {telegram_id}: {e}")
+        finally:
+            _alert_queue.task_done()
+
+def format_alert(jobs: List[Dict]) -> str:
+    """Combine several jobs into a single alert message (title and platform Markdown-escaped)"""
+    return "\n\n".join(
+        _ALERT_JOB_TEMPLATE.format_map({
+            **job,
+            "title": escape_markdown(job["title"] or ""),
+            "platform": escape_markdown(job["platform"] or ""),
+        })
+        for job in jobs
     )
-    await update.message.reply_text(help_text, parse_mode="Markdown")
 
 # ============ CRON JOBS ============
 async def fetch_jobs_job(context: ContextTypes.DEFAULT_TYPE):
     """Periodic job fetcher"""
     logger.info("Fetching jobs...")
-    fetch_all_jobs()
+    await fetch_all_jobs()
+
+async def _dispatch_one(semaphore: asyncio.Semaphore, user_id: int, telegram_id: int,
+                        filters: Dict, since: Optional[str]):
+    """Look up one user's new jobs and queue them as a single alert"""
+    async with semaphore:
+        try:
+            jobs = await asyncio.to_thread(get_new_jobs, user_id, filters, since, ALERT_JOBS_PER_USER)
+            if jobs:
+                # One message per user; jobs are marked sent once it is delivered
+                job_ids = [j["id"] for j in jobs]
+                await _alert_queue.put((telegram_id, format_alert(jobs), user_id, job_ids))
+        except Exception as e:
+            logger.error(f"Error queueing alert for {telegram_id}: {e}")
 
 async def send_alerts_job(context: ContextTypes.DEFAULT_TYPE):
     """Send alerts to premium users"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT id, telegram_id FROM users WHERE subscription_level = 'premium'")
-    users = c.fetchall()
-    conn.close()
+    users = await asyncio.to_thread(get_premium_users)
     
     logger.info(f"Sending alerts to {len(users)} premium users")
     
-    for user_id, telegram_id in users:
-        try:
-            jobs = get_unsent_jobs(user_id, telegram_id)
-            if jobs:
-                # Send first 5 jobs
-                for job in jobs[:5]:
-                    job_text = f"*{job['title']}* ({job['platform']})\n[View]({job['url']})"
-                    await context.bot.send_message(telegram_id, job_text, parse_mode="Markdown")
-                
-                # Mark as sent
-                job_ids = [j["id"] for j in jobs[:5]]
-                mark_jobs_sent(user_id, job_ids)
-        except Exception as e:
-            logger.error(f"Error sending alert to {telegram_id}: {e}")
+    # Users are independent, so look them up concurrently; delivery itself is
+    # still paced by the outbound queue's rate limiter
+    semaphore = asyncio.Semaphore(ALERT_DISPATCH_CONCURRENCY)
+    await asyncio.gather(
+        *[_dispatch_one(semaphore, user_id, telegram_id,
+                        json.loads(filters_json) if filters_json else {}, last_seen)
+          for user_id, telegram_id, filters_json, last_seen in users],
+        return_exceptions=True
+    )
+
+async def cleanup_job(context: ContextTypes.DEFAULT_TYPE):
+    """Periodic cleanup of old jobs and alert history"""
+    await asyncio.to_thread(cleanup_old_jobs)
 
 async def post_init(application: Application):
     """Setup after bot initialization"""
     job_queue = application.job_queue
     
     # Fetch jobs every hour
-    job_queue.run_repeating(fetch_jobs_job, interval=3600, first=0)
+    job_queue.run_repeating(fetch_jobs_job, interval=JOBS_FETCH_INTERVAL, first=0)
     
     # Send alerts every hour to premium users
-    job_queue.run_repeating(send_alerts_job, interval=3600, first=300)
+    job_queue.run_repeating(send_alerts_job, interval=JOBS_FETCH_INTERVAL, first=300)
+    
+    # Database maintenance: hourly cleanup + optimize, vacuum once a week
+    job_queue.run_repeating(cleanup_job, interval=JOBS_FETCH_INTERVAL, first=600)
+    
+    # Workers draining the outbound alert queue
+    for _ in range(ALERT_SENDER_WORKERS):
+        _alert_workers.append(asyncio.create_task(_alert_sender(application.bot)))
+
+async def post_shutdown(application: Application):
+    """Release resources on shutdown"""
+    for worker in _alert_workers:
+        worker.cancel()
+    await asyncio.gather(*_alert_workers, return_exceptions=True)
+    _alert_workers.clear()
+    await _close_http_session()
+    await asyncio.to_thread(stop_write_flusher)
 
 # ============ MAIN ============
 def main():
     """Start the bot"""
     init_db()
     
-    application = Application.builder().token(BOT_TOKEN).post_init(post_init).build()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
     # Handlers
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("filter", show_filters))
+    if ENABLE_SKILL_FILTERING:
+        application.add_handler(CommandHandler("skills", set_skills))
     application.add_handler(CommandHandler("jobs", show_jobs))
     application.add_handler(CommandHandler("upgrade", upgrade))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CallbackQueryHandler(button_callback))
     
-    logger.info("Bot starting...")
-    application.run_polling()
+    if PUBLIC_URL:
+        logger.info("Bot starting (webhook)...")
+        application.run_webhook(
+            listen="0.0.0.0",
+            port=WEBHOOK_PORT,
+            url_path=BOT_TOKEN,
+            webhook_url=f"{PUBLIC_URL}/{BOT_TOKEN}",
+            secret_token=WEBHOOK_SECRET
+        )
+    else:
+        logger.info("Bot starting (polling)...")
+        application.run_polling()
 
 if __name__ == "__main__":
     main()
@@ -37,6 +37,6 @@ REQUESTS_TIMEOUT = 10  # seconds
 MAX_RETRIES = 3
 
 # ============ FEATURES ============
-ENABLE_SKILL_FILTERING = False  # TODO: Implement
+ENABLE_SKILL_FILTERING = os.getenv("ENABLE_SKILL_FILTERING", "1") != "0"  # bot.py gates /skills on the same variable
 ENABLE_BUDGET_FILTERING = False  # TODO: Implement in phase 2
-ENABLE_WEBHOOKS = False  # TODO: Implement for scale
+ENABLE_WEBHOOKS = bool(os.getenv("PUBLIC_URL"))  # bot.py uses webhooks when PUBLIC_URL is set
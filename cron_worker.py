@@ -2,18 +2,34 @@
 """
 Standalone cron worker - runs periodic jobs without keeping bot online
 Fetch jobs and queue alerts for sending
+
+bot.py schedules fetching, alerts and cleanup on its own job queue, so this
+script is only needed when the bot is not running as a long-lived process.
 """
 
 import os
 import sqlite3
 import json
-import requests
+import aiohttp
+import asyncio
+import ijson
 import logging
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import hashlib
 
 DB_PATH = "freelance_bot.db"
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+HN_API_URL = "https://hacker-news.firebaseio.com/v0"
+HN_MAX_CONCURRENT_REQUESTS = 20
+HTTP_CONNECTION_LIMIT = 50
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=10)
+ALERT_JOBS_PER_USER = 5
+DELETE_JOBS_OLDER_THAN_DAYS = 30
+DELETE_ALERT_HISTORY_OLDER_THAN_DAYS = 90
+VACUUM_INTERVAL = timedelta(days=7)
+VACUUM_STAMP_PATH = DB_PATH + ".vacuumed"  # mtime records the last VACUUM
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,30 +41,76 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# ============ DATABASE ============
+_SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA foreign_keys=ON",
+)
+
+_local = threading.local()
+
+def _get_conn():
+    """Return this thread's long-lived SQLite connection (opened on first use)"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+        for pragma in _SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        _local.conn = conn
+    return conn
+
+@contextmanager
+def _transaction():
+    """Run a block of writes inside one BEGIN IMMEDIATE/COMMIT"""
+    conn = _get_conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
 # ============ JOB FETCHERS ============
-def fetch_remoteok_jobs():
+async def _get_json_prefix(session, url, limit):
+    """GET a JSON array, parsing only its first ``limit`` items"""
+    async with session.get(url, timeout=HTTP_TIMEOUT) as response:
+        if response.status != 200:
+            return None
+        items = []
+        async for item in ijson.items_async(response.content, "item", use_float=True):
+            items.append(item)
+            if len(items) >= limit:
+                break
+        return items
+
+async def fetch_remoteok_jobs(session):
     """Fetch jobs from RemoteOK"""
     try:
-        response = requests.get("https://remoteok.io/api", timeout=10)
         jobs = []
+        data = await _get_json_prefix(session, "https://remoteok.io/api", 20)
+        if not data:
+            return jobs
         
-        if response.status_code == 200:
-            data = response.json()
-            for job in data[:20]:
-                if job.get("type") != "job":
-                    continue
-                
-                jobs.append({
-                    "id": f"remoteok_{job.get('id')}",
-                    "title": job.get("position"),
-                    "description": job.get("description", "")[:500],
-                    "budget_min": None,
-                    "budget_max": None,
-                    "skills": json.dumps(job.get("tags", [])),
-                    "url": job.get("url"),
-                    "platform": "RemoteOK",
-                    "posted_at": datetime.now().isoformat()
-                })
+        for job in data:
+            if job.get("type") != "job":
+                continue
+            
+            jobs.append({
+                "id": f"remoteok_{job.get('id')}",
+                "title": job.get("position"),
+                "description": job.get("description", "")[:500],
+                "budget_min": None,
+                "budget_max": None,
+                "skills": json.dumps(job.get("tags", [])),
+                "url": job.get("url"),
+                "platform": "RemoteOK",
+                "posted_at": datetime.now().isoformat()
+            })
         
         logger.info(f"Fetched {len(jobs)} jobs from RemoteOK")
         return jobs
@@ -56,41 +118,44 @@ def fetch_remoteok_jobs():
         logger.error(f"Error fetching RemoteOK jobs: {e}")
         return []
 
-def fetch_hn_jobs():
+async def _fetch_hn_item(session, semaphore, job_id):
+    """Fetch a single HN item, bounded by the shared semaphore"""
+    async with semaphore:
+        async with session.get(f"{HN_API_URL}/item/{job_id}.json") as response:
+            if response.status != 200:
+                return None
+            return await response.json()
+
+async def fetch_hn_jobs(session):
     """Fetch jobs from Hacker News"""
     try:
-        response = requests.get(
-            "https://hacker-news.firebaseio.com/v0/jobstories.json",
-            timeout=10
+        job_ids = await _get_json_prefix(session, f"{HN_API_URL}/jobstories.json", 10)
+        if not job_ids:
+            return []
+        
+        semaphore = asyncio.Semaphore(HN_MAX_CONCURRENT_REQUESTS)
+        results = await asyncio.gather(
+            *[asyncio.wait_for(_fetch_hn_item(session, semaphore, job_id), timeout=5)
+              for job_id in job_ids],
+            return_exceptions=True
         )
         
         jobs = []
-        if response.status_code == 200:
-            job_ids = response.json()[:10]
+        for job_data in results:
+            if isinstance(job_data, Exception) or not job_data:
+                continue
             
-            for job_id in job_ids:
-                try:
-                    job_response = requests.get(
-                        f"https://hacker-news.firebaseio.com/v0/item/{job_id}.json",
-                        timeout=5
-                    )
-                    
-                    if job_response.status_code == 200:
-                        job_data = job_response.json()
-                        
-                        jobs.append({
-                            "id": f"hn_{job_data.get('id')}",
-                            "title": job_data.get("title"),
-                            "description": job_data.get("text", "")[:500],
-                            "budget_min": None,
-                            "budget_max": None,
-                            "skills": "[]",
-                            "url": job_data.get("url", ""),
-                            "platform": "Hacker News",
-                            "posted_at": datetime.now().isoformat()
-                        })
-                except:
-                    continue
+            jobs.append({
+                "id": f"hn_{job_data.get('id')}",
+                "title": job_data.get("title"),
+                "description": job_data.get("text", "")[:500],
+                "budget_min": None,
+                "budget_max": None,
+                "skills": "[]",
+                "url": job_data.get("url", ""),
+                "platform": "Hacker News",
+                "posted_at": datetime.now().isoformat()
+            })
         
         logger.info(f"Fetched {len(jobs)} jobs from HN")
         return jobs
@@ -98,95 +163,130 @@ def fetch_hn_jobs():
         logger.error(f"Error fetching HN jobs: {e}")
         return []
 
+async def fetch_all_jobs_async():
+    """Fetch from all sources concurrently over one shared HTTP session"""
+    connector = aiohttp.TCPConnector(limit=HTTP_CONNECTION_LIMIT)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        results = await asyncio.gather(
+            fetch_remoteok_jobs(session),
+            fetch_hn_jobs(session),
+            return_exceptions=True
+        )
+    
+    all_jobs = []
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Error fetching jobs: {result}")
+            continue
+        all_jobs.extend(result)
+    return all_jobs
+
 def fetch_all_jobs():
     """Fetch from all sources and save to DB"""
-    all_jobs = []
-    all_jobs.extend(fetch_remoteok_jobs())
-    all_jobs.extend(fetch_hn_jobs())
+    all_jobs = asyncio.run(fetch_all_jobs_async())
     
     logger.info(f"Fetched {len(all_jobs)} total jobs")
     
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    rows = [
+        (job["id"], job["title"], job["description"],
+         job.get("budget_min"), job.get("budget_max"),
+         job["skills"], job["url"], job["platform"], job["posted_at"])
+        for job in all_jobs
+    ]
     
-    for job in all_jobs:
-        try:
-            c.execute('''INSERT OR IGNORE INTO jobs 
+    try:
+        with _transaction() as conn:
+            conn.executemany('''INSERT OR IGNORE INTO jobs 
                 (id, title, description, budget_min, budget_max, skills, url, platform, posted_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                (job["id"], job["title"], job["description"], 
-                 job.get("budget_min"), job.get("budget_max"),
-                 job["skills"], job["url"], job["platform"], job["posted_at"]))
-        except Exception as e:
-            logger.error(f"Error inserting job: {e}")
-    
-    conn.commit()
-    conn.close()
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+    except Exception as e:
+        logger.error(f"Error inserting jobs: {e}")
     
     logger.info("Job fetch complete")
 
 def send_alerts_to_premium_users():
     """Queue alerts for all premium users"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # Get premium users who haven't been alerted in last hour
-    one_hour_ago = (datetime.now() - timedelta(hours=1)).isoformat()
-    c.execute("""
-        SELECT id, telegram_id FROM users 
-        WHERE subscription_level = 'premium' 
-        AND (last_alert_sent IS NULL OR last_alert_sent < ?)
-    """, (one_hour_ago,))
-    
-    users = c.fetchall()
-    logger.info(f"Preparing alerts for {len(users)} users")
-    
-    alerts_queued = 0
-    for user_id, telegram_id in users:
-        # Get new jobs for this user (not sent yet)
+    with _transaction() as conn:
+        c = conn.cursor()
+        
+        # Pick the oldest unsent jobs from each user's last-seen cursor on for
+        # every premium user who hasn't been alerted in the last hour, in a
+        # single set-oriented query; oldest first so the cursor never skips
+        # past jobs that weren't queued
+        one_hour_ago = (datetime.now() - timedelta(hours=1)).isoformat()
         c.execute("""
-            SELECT id, title, url, platform FROM jobs 
-            WHERE id NOT IN (SELECT job_id FROM user_jobs_sent WHERE user_id = ?)
-            ORDER BY posted_at DESC LIMIT 5
-        """, (user_id,))
+            WITH ranked AS (
+                SELECT u.id AS user_id, u.telegram_id, j.id AS job_id, j.posted_at,
+                       ROW_NUMBER() OVER (PARTITION BY u.id ORDER BY j.posted_at, j.id) AS rn
+                FROM users u
+                JOIN jobs j ON j.posted_at >= COALESCE(u.last_job_seen_posted_at, '1970-01-01')
+                WHERE u.subscription_level = 'premium'
+                AND NOT EXISTS (SELECT 1 FROM user_jobs_sent s WHERE s.user_id = u.id AND s.job_id = j.id)
+                AND (u.last_alert_sent IS NULL OR u.last_alert_sent < ?)
+            )
+            SELECT user_id, telegram_id, job_id, posted_at FROM ranked WHERE rn <= ?
+        """, (one_hour_ago, ALERT_JOBS_PER_USER))
         
-        new_jobs = c.fetchall()
+        rows = c.fetchall()
+        queued_per_user = {}
+        last_seen = {}
+        for user_id, telegram_id, job_id, posted_at in rows:
+            queued_per_user[telegram_id] = queued_per_user.get(telegram_id, 0) + 1
+            last_seen[user_id] = max(last_seen.get(user_id, posted_at), posted_at)
+        logger.info(f"Preparing alerts for {len(queued_per_user)} users")
         
-        if new_jobs:
-            # Create alert record (for future webhook/API integration)
-            for job_id, title, url, platform in new_jobs:
-                c.execute("""
-                    INSERT OR IGNORE INTO user_jobs_sent (user_id, job_id) 
-                    VALUES (?, ?)
-                """, (user_id, job_id))
+        if rows:
+            # Create alert records (for future webhook/API integration)
+            c.executemany("""
+                INSERT OR IGNORE INTO user_jobs_sent (user_id, job_id) 
+                VALUES (?, ?)
+            """, [(user_id, job_id) for user_id, telegram_id, job_id, posted_at in rows])
             
-            # Update last alert sent
-            c.execute(
-                "UPDATE users SET last_alert_sent = ? WHERE id = ?",
-                (datetime.now().isoformat(), user_id)
+            # Update last alert sent and advance each user's job cursor
+            now = datetime.now().isoformat()
+            c.executemany(
+                "UPDATE users SET last_alert_sent = ?, last_job_seen_posted_at = ? WHERE id = ?",
+                [(now, posted_at, user_id) for user_id, posted_at in last_seen.items()]
             )
-            
-            alerts_queued += len(new_jobs)
-            logger.info(f"Queued {len(new_jobs)} jobs for user {telegram_id}")
-    
-    conn.commit()
-    conn.close()
+        
+        for telegram_id, count in queued_per_user.items():
+            logger.info(f"Queued {count} jobs for user {telegram_id}")
     
-    logger.info(f"Total alerts queued: {alerts_queued}")
+    logger.info(f"Total alerts queued: {len(rows)}")
 
 def cleanup_old_jobs():
-    """Remove jobs older than 30 days"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    thirty_days_ago = (datetime.now() - timedelta(days=30)).isoformat()
-    c.execute("DELETE FROM jobs WHERE posted_at < ?", (thirty_days_ago,))
+    """Remove old jobs and alert history, then run database maintenance"""
+    c = _get_conn().cursor()
     
+    jobs_cutoff = (datetime.now() - timedelta(days=DELETE_JOBS_OLDER_THAN_DAYS)).isoformat()
+    c.execute("DELETE FROM jobs WHERE posted_at < ?", (jobs_cutoff,))
     deleted = c.rowcount
-    conn.commit()
-    conn.close()
     
-    logger.info(f"Cleaned up {deleted} old jobs")
+    # Drop sent markers whose job is gone once they age out of the history window
+    history_cutoff = (datetime.now() - timedelta(days=DELETE_ALERT_HISTORY_OLDER_THAN_DAYS)).isoformat(sep=" ")
+    c.execute("""
+        DELETE FROM user_jobs_sent
+        WHERE sent_at < ?
+        AND NOT EXISTS (SELECT 1 FROM jobs WHERE jobs.id = user_jobs_sent.job_id)
+    """, (history_cutoff,))
+    deleted_history = c.rowcount
+    
+    logger.info(f"Cleaned up {deleted} old jobs and {deleted_history} old alert records")
+    
+    # Keep planner statistics current after bulk deletes
+    c.execute("PRAGMA optimize")
+    c.execute("ANALYZE")
+    
+    # Reclaim free pages at most once a week
+    try:
+        last_vacuum = datetime.fromtimestamp(os.path.getmtime(VACUUM_STAMP_PATH))
+    except OSError:
+        last_vacuum = None
+    if last_vacuum is None or datetime.now() - last_vacuum >= VACUUM_INTERVAL:
+        logger.info("Vacuuming database...")
+        c.execute("VACUUM")
+        with open(VACUUM_STAMP_PATH, "w") as f:
+            f.write(datetime.now().isoformat())
 
 def main():
     """Main cron job"""
@@ -21,8 +21,6 @@ echo "   export TELEGRAM_BOT_TOKEN='your_token_here'"
 echo "3. Start the bot:"
 echo "   python3 bot.py"
 echo ""
-echo "4. Setup cron job for alerts (runs every hour):"
-echo "   crontab -e"
-echo "   Add: 0 * * * * cd /path/to/freelance-bot && /path/to/venv/bin/python3 cron_worker.py"
+echo "   (fetching, alerts and cleanup run hourly inside the bot - no cron job needed)"
 echo ""
 echo "✅ Setup complete!"
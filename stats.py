@@ -2,238 +2,392 @@
 """
 Stats & management script for Freelance Job Alerts Bot
 Run this to check health, user metrics, and debug issues
+
+Usage: python3 stats.py [--health-only]
 """
 
-import sqlite3
-import json
-from datetime import datetime, timedelta
+import os
+import sys
+import time
+import getpass
+import functools
+import subprocess
+from datetime import datetime, timedelta, timezone
 from config import DB_PATH
 
+# sqlite3, json and concurrent.futures are imported where the database reports
+# need them, so `--health-only` (the quick "is the bot up" check) never loads them
+
+# Connections open the database read-only (bot.py already puts it in WAL mode,
+# so these reads run alongside its writes); query_only keeps the diagnostics
+# from ever taking a write lock
+_SQLITE_PRAGMAS = (
+    "PRAGMA cache_size=-65536",  # 64 MB
+    "PRAGMA mmap_size=268435456",  # 256 MB
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA query_only=1",
+)
+
+_SEP = "=" * 60
+
+# Sections run concurrently, one read connection each
+STATS_WORKERS = 4
+
+def _connect():
+    """Open a read-only stats connection (usable from a worker thread)"""
+    import sqlite3
+    
+    if not os.path.exists(DB_PATH):
+        raise FileNotFoundError(DB_PATH)
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, check_same_thread=False)
+    for pragma in _SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
 def print_header(text):
-    print("\n" + "="*60)
-    print(f"  {text}")
-    print("="*60)
+    sys.stdout.write(f"\n{_SEP}\n  {text}\n{_SEP}\n")
 
-def get_user_stats():
-    """User metrics"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+class Section:
+    """One report section's output, collected so it can be written in a single call"""
     
-    print_header("USER STATS")
+    def __init__(self, title):
+        self.buf = [f"\n{_SEP}\n  {title}\n{_SEP}\n"]
     
-    # Total users
-    c.execute("SELECT COUNT(*) FROM users")
-    total_users = c.fetchone()[0]
-    print(f"📊 Total Users: {total_users}")
+    def line(self, text=""):
+        self.buf.append(text + "\n")
     
-    # Premium vs Free
-    c.execute("SELECT subscription_level, COUNT(*) FROM users GROUP BY subscription_level")
-    for level, count in c.fetchall():
-        print(f"   • {level.upper()}: {count} ({count*100//max(1,total_users)}%)")
-    
-    # New users (last 7 days)
-    c.execute("""
-        SELECT COUNT(*) FROM users 
-        WHERE created_at > datetime('now', '-7 days')
-    """)
-    new_7d = c.fetchone()[0]
-    print(f"   • New (last 7 days): {new_7d}")
-    
-    # Active users (used /jobs in last 24h)
-    c.execute("""
-        SELECT COUNT(DISTINCT user_id) FROM user_jobs_sent 
-        WHERE sent_at > datetime('now', '-1 day')
-    """)
-    active_24h = c.fetchone()[0]
-    print(f"   • Active (last 24h): {active_24h}")
-    
-    conn.close()
-
-def get_job_stats():
-    """Job metrics"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    def flush(self):
+        sys.stdout.write("".join(self.buf))
+
+# Repeat runs within the TTL (e.g. dashboard polling) reuse each report's lines
+# and result instead of re-running its queries. The cache lives in its own
+# database file next to the bot's, so stats.py never writes to the bot's tables;
+# it is read once per run and fresh results are written back in one go by
+# _save_stats_cache.
+STATS_CACHE_TTL = 60  # seconds
+STATS_CACHE_PATH = f"{DB_PATH}.stats-cache"
+_cache_pending = []
+
+@functools.lru_cache(maxsize=None)
+def _stats_cache():
+    """Cached reports from earlier runs as {key: (cached, ts)}, loaded once per run"""
+    import json
+    import sqlite3
     
-    print_header("JOB STATS")
+    try:
+        conn = sqlite3.connect(f"file:{STATS_CACHE_PATH}?mode=ro", uri=True)
+        try:
+            rows = conn.execute("SELECT key, value, ts FROM stats_cache").fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return {}  # no cache file until the first save, or an unreadable one
+    return {key: (json.loads(value), ts) for key, value, ts in rows}
+
+def memoize_ttl(ttl):
+    """Cache a report (called as f(conn, ..., section)) in the stats cache for `ttl` seconds"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(conn, *args):
+            section = args[-1]
+            key = func.__name__
+            entry = _stats_cache().get(key)
+            if entry and time.time() - entry[1] < ttl:
+                cached = entry[0]
+                section.buf.extend(cached["lines"])
+                return cached["result"]
+            
+            start = len(section.buf)
+            result = func(conn, *args)
+            _cache_pending.append((key, {"lines": section.buf[start:], "result": result}, time.time()))
+            return result
+        return wrapper
+    return decorator
+
+def _save_stats_cache():
+    """Write the reports computed this run to the stats cache file (best effort)"""
+    import json
+    import sqlite3
+    
+    if not _cache_pending:
+        return
+    conn = None
+    try:
+        conn = sqlite3.connect(STATS_CACHE_PATH, timeout=1)
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS stats_cache (key TEXT PRIMARY KEY, value TEXT, ts REAL)")
+            conn.executemany("INSERT OR REPLACE INTO stats_cache (key, value, ts) VALUES (?, ?, ?)",
+                             [(key, json.dumps(value), ts) for key, value, ts in _cache_pending])
+    except sqlite3.Error:
+        pass  # cache file busy, unwritable or corrupt; the next run recomputes
+    finally:
+        if conn is not None:
+            conn.close()
+    _cache_pending.clear()
+
+def get_cutoffs():
+    """Report time windows as UTC 'YYYY-MM-DD HH:MM:SS' strings, matching CURRENT_TIMESTAMP"""
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    return {
+        "now": now.isoformat(sep=" "),
+        "day_ago": (now - timedelta(days=1)).isoformat(sep=" "),
+        "week_ago": (now - timedelta(days=7)).isoformat(sep=" "),
+        "midnight": now.replace(hour=0, minute=0, second=0).isoformat(sep=" "),
+    }
+
+@memoize_ttl(STATS_CACHE_TTL)
+def get_user_stats(conn, cutoffs, section):
+    """User metrics"""
+    # Total, free/premium split with integer percentages, new (last 7 days) and
+    # active (used /jobs in last 24h) in a single statement
+    (total_users, free_users, premium_users, free_pct, premium_pct,
+     new_7d, active_24h) = conn.execute("""
+        SELECT COUNT(*),
+               COUNT(CASE WHEN subscription_level = 'free' THEN 1 END),
+               COUNT(CASE WHEN subscription_level = 'premium' THEN 1 END),
+               COUNT(CASE WHEN subscription_level = 'free' THEN 1 END) * 100 / NULLIF(COUNT(*), 0),
+               COUNT(CASE WHEN subscription_level = 'premium' THEN 1 END) * 100 / NULLIF(COUNT(*), 0),
+               COUNT(CASE WHEN created_at > :week_ago THEN 1 END),
+               (SELECT COUNT(DISTINCT user_id) FROM user_jobs_sent  -- covered by idx_ujs_sent_user
+                WHERE sent_at > :day_ago)
+        FROM users
+    """, cutoffs).fetchone()
+    section.line(f"📊 Total Users: {total_users}")
     
-    # Total jobs
-    c.execute("SELECT COUNT(*) FROM jobs")
-    total_jobs = c.fetchone()[0]
-    print(f"💼 Total Jobs: {total_jobs}")
+    # Premium vs Free
+    for level, count, pct in (("free", free_users, free_pct), ("premium", premium_users, premium_pct)):
+        if count:
+            section.line(f"   • {level.upper()}: {count} ({pct}%)")
+    
+    section.line(f"   • New (last 7 days): {new_7d}")
+    section.line(f"   • Active (last 24h): {active_24h}")
+    
+    return {
+        "total": total_users,
+        "free": free_users,
+        "premium": premium_users,
+        "new_7d": new_7d,
+        "active_24h": active_24h,
+    }
+
+@memoize_ttl(STATS_CACHE_TTL)
+def get_job_stats(conn, cutoffs, section):
+    """Job metrics"""
+    # Total and average age come from trigger-maintained counters (see
+    # bot.init_db); fresh (last 24h) is a range count on idx_jobs_posted_at
+    total_jobs, fresh_24h, avg_age = conn.execute("""
+        SELECT (SELECT value FROM counters WHERE name = 'jobs'),
+               (SELECT COUNT(*) FROM jobs WHERE posted_at > :day_ago),
+               (SELECT (julianday(:now) - s.value / NULLIF(n.value, 0)) * 24
+                FROM counters s, counters n
+                WHERE s.name = 'jobs_posted_julian_sum' AND n.name = 'jobs_posted_count')
+    """, cutoffs).fetchone()
+    section.line(f"💼 Total Jobs: {total_jobs}")
+    
+    if not total_jobs:
+        section.line(f"   • Added (last 24h): 0")
+        return
     
     # By platform
-    c.execute("SELECT platform, COUNT(*) FROM jobs GROUP BY platform ORDER BY COUNT(*) DESC")
-    for platform, count in c.fetchall():
-        print(f"   • {platform}: {count}")
-    
-    # Fresh jobs (last 24h)
-    c.execute("""
-        SELECT COUNT(*) FROM jobs 
-        WHERE posted_at > datetime('now', '-1 day')
-    """)
-    fresh_24h = c.fetchone()[0]
-    print(f"   • Added (last 24h): {fresh_24h}")
-    
-    # Average job age
-    c.execute("""
-        SELECT AVG((julianday('now') - julianday(posted_at)) * 24) as avg_hours
-        FROM jobs
-    """)
-    avg_age = c.fetchone()[0]
-    if avg_age:
-        print(f"   • Average age: {avg_age:.1f} hours")
-    
-    conn.close()
-
-def get_revenue_stats():
-    """Revenue metrics (projections)"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    print_header("REVENUE STATS")
-    
-    # Premium users
-    c.execute("SELECT COUNT(*) FROM users WHERE subscription_level = 'premium'")
-    premium_users = c.fetchone()[0]
+    for platform, count in conn.execute(
+        "SELECT platform, COUNT(*) FROM jobs GROUP BY platform ORDER BY COUNT(*) DESC"
+    ):
+        section.line(f"   • {platform}: {count}")
+    
+    section.line(f"   • Added (last 24h): {fresh_24h}")
+    # NULL only when no job has a parseable posted_at
+    if avg_age is not None:
+        section.line(f"   • Average age: {avg_age:.1f} hours")
+
+def get_revenue_stats(user_counts, section):
+    """Revenue metrics (projections) from get_user_stats' counts"""
+    premium_users = user_counts["premium"]
     
     # Estimate MRR (assuming 30-day subscription)
     STARS_PER_MONTH = 200
     STARS_TO_USD = 1/100  # Rough estimate
     estimated_mrr = premium_users * STARS_PER_MONTH * STARS_TO_USD
     
-    print(f"💰 Premium Users: {premium_users}")
-    print(f"   • Estimated MRR: ${estimated_mrr:.2f}")
-    print(f"   • Monthly subscription: 200⭐ (~$2 USD)")
+    section.line(f"💰 Premium Users: {premium_users}")
+    section.line(f"   • Estimated MRR: ${estimated_mrr:.2f}")
+    section.line(f"   • Monthly subscription: 200⭐ (~$2 USD)")
     
     # Conversion rate
-    c.execute("SELECT COUNT(*) FROM users WHERE subscription_level = 'free'")
-    free_users = c.fetchone()[0]
+    free_users = user_counts["free"]
     
     total = premium_users + free_users
     if total > 0:
         conversion = (premium_users / total) * 100
-        print(f"   • Conversion rate: {conversion:.1f}%")
+        section.line(f"   • Conversion rate: {conversion:.1f}%")
     
     # Projected revenue at scale
-    print(f"\n📈 Projections (assuming current conversion):")
+    section.line(f"\n📈 Projections (assuming current conversion):")
     for scale in [100, 500, 1000]:
         projected_premium = int(scale * (premium_users / max(1, total)))
         projected_mrr = projected_premium * STARS_PER_MONTH * STARS_TO_USD
-        print(f"   • At {scale} users: ${projected_mrr:.2f} MRR (~{projected_premium} premium)")
-    
-    conn.close()
+        section.line(f"   • At {scale} users: ${projected_mrr:.2f} MRR (~{projected_premium} premium)")
 
-def get_alert_stats():
+@memoize_ttl(STATS_CACHE_TTL)
+def get_alert_stats(conn, cutoffs, section):
     """Alert delivery metrics"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    print_header("ALERT STATS")
-    
-    # Total alerts sent
-    c.execute("SELECT COUNT(*) FROM user_jobs_sent")
-    total_alerts = c.fetchone()[0]
-    print(f"📬 Total alerts sent: {total_alerts}")
-    
-    # Alerts today
-    c.execute("""
-        SELECT COUNT(*) FROM user_jobs_sent 
-        WHERE sent_at > datetime('now', 'start of day')
-    """)
-    today_alerts = c.fetchone()[0]
-    print(f"   • Today: {today_alerts}")
-    
-    # Top 5 users (by clicks)
-    c.execute("""
-        SELECT user_id, COUNT(*) as clicks FROM user_jobs_sent 
-        GROUP BY user_id 
-        ORDER BY clicks DESC LIMIT 5
-    """)
-    print(f"\n   🔥 Top users by engagement:")
-    for user_id, clicks in c.fetchall():
-        print(f"      User {user_id}: {clicks} jobs viewed")
-    
-    # Check if cron is running (last fetch time)
-    c.execute("SELECT MAX(fetched_at) FROM jobs")
-    last_fetch = c.fetchone()[0]
+    # Total alerts sent (trigger-maintained counter) and alerts today
+    total_alerts, today_alerts = conn.execute("""
+        SELECT (SELECT value FROM counters WHERE name = 'user_jobs_sent'),
+               (SELECT COUNT(*) FROM user_jobs_sent
+                WHERE sent_at > :midnight)
+    """, cutoffs).fetchone()
+    section.line(f"📬 Total alerts sent: {total_alerts}")
+    section.line(f"   • Today: {today_alerts}")
+    
+    # Top 5 users (by clicks), from the trigger-maintained user_alert_counts
+    section.line(f"\n   🔥 Top users by engagement:")
+    for user_id, clicks in conn.execute(
+        "SELECT user_id, n FROM user_alert_counts WHERE n > 0 ORDER BY n DESC LIMIT 5"
+    ):
+        section.line(f"      User {user_id}: {clicks} jobs viewed")
+    
+    # Check if fetching is running (last fetch time)
+    last_fetch = conn.execute("SELECT MAX(fetched_at) FROM jobs").fetchone()[0]
     if last_fetch:
-        print(f"\n   ⏰ Last job fetch: {last_fetch}")
+        section.line(f"\n   ⏰ Last job fetch: {last_fetch}")
     else:
-        print(f"\n   ⚠️  No jobs fetched yet - cron job may not be running!")
-    
-    conn.close()
+        section.line(f"\n   ⚠️  No jobs fetched yet - is bot.py running?")
 
-def get_db_health():
+@memoize_ttl(STATS_CACHE_TTL)
+def get_db_health(conn, section):
     """Database health check"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    print_header("DATABASE HEALTH")
-    
-    # Check table sizes
-    c.execute("SELECT page_count * page_size as size FROM pragma_page_count(), pragma_page_size()")
-    db_size = c.fetchone()[0]
-    print(f"📁 DB Size: {db_size / 1024 / 1024:.2f} MB")
-    
-    # Table row counts
+    # File size on disk, including the WAL and its shared-memory index
+    db_size = sum(os.path.getsize(path)
+                  for path in (DB_PATH, f"{DB_PATH}-wal", f"{DB_PATH}-shm")
+                  if os.path.exists(path))
+    section.line(f"📁 DB Size: {db_size / 1024 / 1024:.2f} MB")
+    
+    # Table row counts (trigger-maintained, see bot.init_db) and the NULL-title
+    # check in one round-trip
     tables = ["users", "jobs", "user_jobs_sent", "payments"]
-    for table in tables:
-        c.execute(f"SELECT COUNT(*) FROM {table}")
-        count = c.fetchone()[0]
-        print(f"   • {table}: {count} rows")
+    *counts, null_titles = conn.execute("""
+        SELECT (SELECT value FROM counters WHERE name = 'users'),
+               (SELECT value FROM counters WHERE name = 'jobs'),
+               (SELECT value FROM counters WHERE name = 'user_jobs_sent'),
+               (SELECT value FROM counters WHERE name = 'payments'),
+               (SELECT COUNT(*) FROM jobs WHERE title IS NULL)
+    """).fetchone()
+    for table, count in zip(tables, counts):
+        section.line(f"   • {table}: {count} rows")
     
     # Check for issues
-    c.execute("SELECT COUNT(*) FROM jobs WHERE title IS NULL")
-    null_titles = c.fetchone()[0]
     if null_titles > 0:
-        print(f"\n⚠️  Warning: {null_titles} jobs with NULL titles - corruption possible")
-    
-    conn.close()
+        section.line(f"\n⚠️  Warning: {null_titles} jobs with NULL titles - corruption possible")
+
+def _process_running(name):
+    """True if another process has `name` in its command line (reads /proc, pgrep elsewhere)"""
+    if not os.path.isdir("/proc"):
+        return bool(subprocess.run(["pgrep", "-f", name], capture_output=True).stdout)
+    
+    needle = name.encode()
+    own_pid = str(os.getpid())
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit() or pid == own_pid:
+            continue
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                if needle in f.read():
+                    return True
+        except OSError:
+            continue  # exited or not ours to read
+    return False
 
-def health_check():
+def _read_crontab():
+    """Current user's crontab, from the spool file when readable, else `crontab -l`"""
+    user = getpass.getuser()
+    for path in (f"/var/spool/cron/crontabs/{user}",  # Debian/Ubuntu
+                 f"/var/spool/cron/{user}",           # RHEL/Fedora
+                 f"/usr/lib/cron/tabs/{user}"):       # macOS
+        try:
+            with open(path) as f:
+                return f.read()
+        except OSError:
+            continue
+    try:
+        return subprocess.run(["crontab", "-l"], capture_output=True, text=True).stdout
+    except FileNotFoundError:
+        return ""  # no cron installed
+
+def _last_line(path, block_size=4096):
+    """Last non-empty line of a file, reading only its tail"""
+    with open(path, "rb") as f:
+        f.seek(max(0, os.path.getsize(path) - block_size))
+        lines = [line for line in f.read().splitlines() if line.strip()]
+    return lines[-1].decode(errors="replace") if lines else ""
+
+def health_check(section):
     """Overall health check"""
-    import subprocess
-    import os
-    
-    print_header("SYSTEM HEALTH CHECK")
-    
     # Is bot running?
-    result = subprocess.run(["pgrep", "-f", "bot.py"], capture_output=True)
-    if result.stdout:
-        print(f"✅ Bot process running")
+    if _process_running("bot.py"):
+        section.line(f"✅ Bot process running")
     else:
-        print(f"❌ Bot process NOT running - users can't use /jobs command!")
+        section.line(f"❌ Bot process NOT running - users can't use /jobs command!")
     
     # Does DB exist?
     if os.path.exists(DB_PATH):
-        print(f"✅ Database exists")
+        section.line(f"✅ Database exists")
     else:
-        print(f"❌ Database NOT found - run 'python3 bot.py' to initialize")
+        section.line(f"❌ Database NOT found - run 'python3 bot.py' to initialize")
     
     # Check cron job (Linux/Mac)
-    result = subprocess.run(["crontab", "-l"], capture_output=True, text=True)
-    if "cron_worker.py" in result.stdout:
-        print(f"✅ Cron job found")
+    if "cron_worker.py" in _read_crontab():
+        section.line(f"✅ Cron job found")
     else:
-        print(f"⚠️  Cron job not found - add with: crontab -e")
+        section.line(f"ℹ️  No cron job (not needed while bot.py is running)")
     
     # Check logs
     if os.path.exists("cron_worker.log"):
-        result = subprocess.run(["tail", "-1", "cron_worker.log"], capture_output=True, text=True)
-        print(f"\n📋 Latest cron log:")
-        print(f"   {result.stdout.strip()}")
+        section.line(f"\n📋 Latest cron log:")
+        section.line(f"   {_last_line('cron_worker.log').strip()}")
+
+def run_reports():
+    """Database reports plus the health check, run concurrently and printed in order"""
+    from concurrent.futures import ThreadPoolExecutor
+    
+    # The sections are independent reads, so run them side by side on their
+    # own WAL connections, buffering each one's output to print in order
+    conns = [_connect() for _ in range(STATS_WORKERS)]
+    try:
+        # Time windows computed once and bound into every query
+        cutoffs = get_cutoffs()
+        sections = [Section(title) for title in (
+            "USER STATS", "JOB STATS", "ALERT STATS",
+            "REVENUE STATS", "DATABASE HEALTH", "SYSTEM HEALTH CHECK",
+        )]
+        user_section, job_section, alert_section, revenue_section, db_section, health_section = sections
+        with ThreadPoolExecutor(max_workers=STATS_WORKERS) as pool:
+            user_counts = pool.submit(get_user_stats, conns[0], cutoffs, user_section)
+            jobs = pool.submit(get_job_stats, conns[1], cutoffs, job_section)
+            alerts = pool.submit(get_alert_stats, conns[2], cutoffs, alert_section)
+            db_health = pool.submit(get_db_health, conns[3], db_section)
+            health = pool.submit(health_check, health_section)
+            get_revenue_stats(user_counts.result(), revenue_section)
+            for future in (jobs, alerts, db_health, health):
+                future.result()
+    finally:
+        for conn in conns:
+            conn.close()
+    
+    for section in sections:
+        section.flush()
+    _save_stats_cache()
 
 def main():
-    """Run all stats"""
+    """Run all stats (or just the system health check with --health-only)"""
     print("\n🤖 FREELANCE JOB ALERTS BOT - STATS & DIAGNOSTICS")
     
     try:
-        get_user_stats()
-        get_job_stats()
-        get_alert_stats()
-        get_revenue_stats()
-        get_db_health()
-        health_check()
+        if "--health-only" in sys.argv[1:]:
+            section = Section("SYSTEM HEALTH CHECK")
+            health_check(section)
+            section.flush()
+        else:
+            run_reports()
         
         print_header("✅ ALL CHECKS COMPLETE")
         
@@ -241,9 +395,15 @@ def main():
         print(f"\n❌ ERROR: Database not found at {DB_PATH}")
         print(f"   Run: python3 -c \"from bot import init_db; init_db()\"")
     except Exception as e:
-        print(f"\n❌ ERROR: {e}")
-        import traceback
-        traceback.print_exc()
+        # sqlite3 is only loaded once the database reports have run
+        sqlite3 = sys.modules.get("sqlite3")
+        if sqlite3 and isinstance(e, sqlite3.OperationalError) and "no such table" in str(e):
+            # Older databases lack the tables the reports read (e.g. counters)
+            print(f"\n❌ ERROR: Database at {DB_PATH} needs migrating ({e})")
+            print(f"   Run: python3 -c \"from bot import init_db; init_db()\"")
+        else:
+            print(f"\n❌ ERROR: {e}")
+            sys.excepthook(type(e), e, e.__traceback__)
 
 if __name__ == "__main__":
     main()